@@ -1,6 +1,10 @@
 import os  # Used for operating system interaction, such as listing files in a directory
 import requests  # Allows you to send HTTP requests to download files
-import time  # Used for pausing the execution of the script (time.sleep)
+from requests.adapters import HTTPAdapter  # Configures connection pooling and retries for the download session
+from urllib3.util.retry import Retry  # Retry policy with backoff for failed or throttled requests
+import shutil  # Used for streaming downloads to disk and moving the rendered page images into place
+import tempfile  # Provides a scratch folder for the rendered page images
+from concurrent.futures import ThreadPoolExecutor  # Runs several downloads and PDF conversions at the same time
 from pdf2image import convert_from_path  # Converts PDF files to images
 
 # URL setup for downloading the PDFs
@@ -9,19 +13,41 @@ districts = ["%.3d" % i for i in range(1, 136)]  # Generate district codes from
 print(districts)  # Print the list of district codes
 religion = "09"  # Suffix for the religion-specific PDF files
 language = "11"  # Suffix for the language-specific PDF files (unused in this script)
+download_workers = 4  # Number of PDFs downloaded at the same time, kept small to avoid overloading the server
+resume_existing = True  # Skip PDFs already downloaded by a previous run; set to False to download everything again
 
-# Download PDFs for each district
-for district_code in districts:
+# One session shared by every download, so connections to the server are kept alive and reused instead of
+# opening a new TCP/TLS connection per file; busy or throttled responses are retried with exponential backoff
+session = requests.Session()
+retries = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+session.mount("https://", HTTPAdapter(pool_maxsize=download_workers, max_retries=retries))
+
+# Function to download the PDF for one district
+def download_district(district_code):
     pdf_link = f"{base_path}{district_code}{religion}.pdf"  # Create the full URL to download the PDF
-    response = requests.get(pdf_link, verify=False)  # Send a request to download the PDF, ignoring SSL verification
+    output_path = f"{district_code}{religion}.pdf"
+    # A PDF only gets its final name once fully downloaded, so an existing non-empty file is complete
+    if resume_existing and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        return
+    try:
+        # Send a request to download the PDF, ignoring SSL verification, and stream the body instead of buffering it
+        with session.get(pdf_link, verify=False, stream=True) as response:
+            # Check if the PDF is available
+            if response.status_code != 200:
+                print(f"Failed to download PDF for district {district_code}")  # Print an error message if download fails
+                return
+            response.raw.decode_content = True  # Let urllib3 undo any gzip/deflate content encoding while copying
+            with open(output_path + ".part", "wb") as f:
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)  # Copy the content to a local file in 1 MiB blocks
+        os.replace(output_path + ".part", output_path)  # Only a complete download gets the final file name
+    except Exception as e:
+        print(f"Failed to download PDF for district {district_code}: {e}")  # Print an error message if the transfer fails
+        if os.path.exists(output_path + ".part"):
+            os.remove(output_path + ".part")  # Remove the partial download so it is not mistaken for a PDF later
 
-    # Check if the PDF was downloaded successfully
-    if response.status_code == 200:
-        with open(f"{district_code}{religion}.pdf", "wb") as f:
-            f.write(response.content)  # Write the content to a PDF file locally
-            time.sleep(3)  # Wait for 3 seconds before making the next request to avoid overloading the server
-    else:
-        print(f"Failed to download PDF for district {district_code}")  # Print an error message if download fails
+# Download the PDFs for all districts, a few at a time
+with ThreadPoolExecutor(max_workers=download_workers) as executor:
+    list(executor.map(download_district, districts))
 
 print("DOWNLOAD MISSION COMPLETE")  # Indicate that all downloads are complete
 
@@ -29,14 +55,24 @@ print("DOWNLOAD MISSION COMPLETE")  # Indicate that all downloads are complete
 file_path = "/Users/..."  # Replace with the actual path to your directory
 file_list = os.listdir(file_path)  # List all files in the specified directory
 print(file_list)  # Print the list of files found in the directory
+dpi = 200  # Rendering resolution; extract_text.py OCRs the pages at this resolution without upsampling
 
-# Convert each PDF file to JPEG images
-for file in file_list:
+# Function to convert one PDF file to JPEG images, one per page
+def convert_file(file):
+    if not file.lower().endswith(".pdf"):
+        return  # Skip anything in the folder that is not a PDF
     try:
-        images = convert_from_path(os.path.join(file_path, file))  # Convert the PDF file to a list of images
-        for i, image in enumerate(images):
-            image.save(file.strip(".pdf") + str(i) + '.jpg', 'JPEG')  # Save each page as a JPEG file
+        # pdftoppm encodes the pages as JPEG files straight into a scratch folder, so no page image is held in memory
+        with tempfile.TemporaryDirectory() as output_folder:
+            pages = convert_from_path(os.path.join(file_path, file), dpi=dpi,
+                                      output_folder=output_folder, fmt="jpeg", paths_only=True)  # Paths in page order
+            for i, page in enumerate(pages):
+                shutil.move(page, file.strip(".pdf") + str(i) + '.jpg')  # Move each page into place as a JPEG file, numbered from 0
     except Exception as e:
         print(f"Error converting {file}: {str(e)}")  # Print an error message if conversion fails
 
+# Convert the PDF files in parallel; the rendering runs in pdftoppm processes, so threads are enough to keep every core busy
+with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+    list(executor.map(convert_file, file_list))
+
 print("CONVERSION MISSION COMPLETE")  # Indicate that all conversions are complete
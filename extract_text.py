@@ -1,89 +1,192 @@
 import os  # Used for operating system dependent functionality like reading files
 import re  # Regular expression library for text matching and manipulation
-import cv2  # OpenCV library for handling image operations
-import pytesseract  # OCR library to convert image text to string data
-import pandas as pd  # Pandas library for data manipulation and analysis
+import io  # Wraps the image bytes read for the cache key so they can be decoded without reading the file again
+import hashlib  # Hashes image contents to key the OCR cache
+from PIL import Image  # Pillow library for handling image operations
 import logging  # Used for logging error messages in a file
+from concurrent.futures import ProcessPoolExecutor  # Runs the OCR of several images in parallel processes
+
+# Each worker runs its own Tesseract, so keep Tesseract's OpenMP to one thread to avoid oversubscribing the cores;
+# this must be set before tesserocr loads libtesseract, whose OpenMP runtime reads the variable only once at load time
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# tesserocr is optional: it keeps Tesseract and its language model loaded between pages instead of starting a new process per image
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+    import pytesseract  # OCR library to convert image text to string data, only needed without tesserocr
 
 # Configure logging to capture errors in a logfile
 logging.basicConfig(filename="logfile.log", level=logging.ERROR)
 
-# Function to remove unnecessary text up to a specified keyword
-def delete_to_k(lst, strings_to_search_for):
+# Function to remove unnecessary text up to the first element matching a compiled keyword pattern
+def delete_to_k(lst, pattern):
     for t, elem in enumerate(lst):
-        for string in strings_to_search_for:
-            if string in elem:
-                del lst[:t]  # Delete all elements in the list before the keyword
-                return lst  # Return the trimmed list
+        if pattern.search(elem):
+            del lst[:t]  # Delete all elements in the list before the keyword
+            return lst  # Return the trimmed list
     return lst  # Return the original list if no keyword is found
 
+# Matches every line holding at least one non-whitespace character, so blank lines are skipped in one regex pass
+line_pattern = re.compile(r"^[^\S\n]*\S.*$", re.MULTILINE)
+# Section headings that are dropped from the OCR lines, held in a set for constant-time lookups
+ignored_lines = frozenset({'OVERALL', 'RURAL', 'URBAN'})
+# Matches the SEXES label on 'ALL SEXES' result lines, whatever its last character was OCR'd as
+sexe_pattern = re.compile(r"( SEXE.|SEXE.)")
+
 # List of keywords to start processing text data
-strings_to_search_for = ['FR','DISTRICT', 'TEHSIL', 'DIVISION', 'AGENCY','TALUKA','MUSAKHEL','DE-EXCLUDED','F.R' ]
+strings_to_search_for = ('FR','DISTRICT', 'TEHSIL', 'DIVISION', 'AGENCY','TALUKA','MUSAKHEL','DE-EXCLUDED','F.R' )
+# Compiled alternation of the keywords, testing a line against every keyword in a single scan
+keyword_pattern = re.compile("|".join(map(re.escape, strings_to_search_for)))
 
-# DataFrame to store all extracted information
-extracted = pd.DataFrame()
+# Column headers of the census table, keyed by the number of columns detected on a page
+column_headers = {
+    7: ['SEX', 'TOTAL', 'MUSLIM', 'CHRISTIAN', "HINDU", 'QADIANI/AHMADI', 'CASTE/SCHEDULED'],
+    8: ['SEX', 'TOTAL', 'MUSLIM', 'CHRISTIAN', "HINDU", 'QADIANI/AHMADI', 'CASTE/SCHEDULED', 'OTHERS'],
+    9: ['SEX', 'TOTAL', 'MUSLIM', 'CHRISTIAN', "HINDU", 'QADIANI/AHMADI', 'CASTE/SCHEDULED', 'OTHERS', 'EXTRACOL'],
+}
 
 # Directory containing images to be processed
 path = "your_path/Pakistan/Religion"
-file_list = os.listdir(path)  # List of all files in the specified directory
-print(file_list)
+# Resolution the pages were rendered at by download_files.py, passed on so Tesseract does not have to guess it
+dpi = 200
+
+# Folder where OCR text is cached by image content, so reruns skip pages that were already OCR'd; set to None to disable
+ocr_cache = "ocr_cache"
+# Engine and Tesseract settings, part of the cache key so changing them invalidates the cached text
+ocr_settings = f"{'tesserocr' if PyTessBaseAPI else 'pytesseract'} --psm 6 --oem 1 --dpi {dpi}"
+
+# Tesseract instance owned by this process, created on first use when tesserocr is installed
+tesseract_api = None
+
+# Function to run OCR on a grayscale page image with single-block layout and the LSTM engine
+def ocr_image(image):
+    global tesseract_api
+    if PyTessBaseAPI is None:
+        return pytesseract.image_to_string(image, config=f"--psm 6 --oem 1 --dpi {dpi}")
+    if tesseract_api is None:
+        tesseract_api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+    tesseract_api.SetImage(image)
+    tesseract_api.SetSourceResolution(dpi)
+    return tesseract_api.GetUTF8Text()
+
+# Function to return the OCR text of an image file, reusing the cached text when the same image was OCR'd before
+def ocr_file(full_path):
+    with open(full_path, "rb") as f:
+        data = f.read()  # Read the image once, both for the cache key and for decoding
+    if ocr_cache is not None:
+        key = hashlib.blake2b(data + ocr_settings.encode(), digest_size=16).hexdigest()
+        cache_file = os.path.join(ocr_cache, key + ".txt")
+        if os.path.exists(cache_file):
+            with open(cache_file, encoding="utf-8") as f:
+                return f.read()
+    # Read the image in grayscale to enhance OCR accuracy; draft lets the JPEG decoder emit grayscale directly
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", image.size)
+    image = image.convert("L")
+    # Use OCR to extract text from the image, handing the PIL image straight to Tesseract at its native resolution
+    text = ocr_image(image)
+    if ocr_cache is not None:
+        # Write to a per-process temporary file and rename it, so other workers never read a half-written entry
+        os.makedirs(ocr_cache, exist_ok=True)
+        temp_file = f"{cache_file}.{os.getpid()}"
+        try:
+            with open(temp_file, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(temp_file, cache_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)  # Remove the temporary file if writing or renaming it failed
+    return text
 
-# Loop through each image file for processing
-for i in file_list:
+# Function to OCR a single image file and return its column headers and rows (None if the file fails);
+# plain lists are returned so the worker processes never have to import pandas
+def process_image(i):
     print(i)  # Print the current file being processed
     full_path = os.path.join(path, i)  # Create full path to the image file
     try:
-        # Read the image in grayscale to enhance OCR accuracy
-        image = cv2.imread(full_path, cv2.IMREAD_GRAYSCALE)
-        # Resize the image to make the text more clear for OCR
-        image = cv2.resize(image, None, fx=1.2, fy=1.2, interpolation=cv2.INTER_CUBIC)
         # Use OCR to extract text from the image
-        text = pytesseract.image_to_string(image, config="--psm 6 --oem 1")
-        # Split text into lines and remove empty or irrelevant lines
-        lines = text.strip().split("\n")
-        lines = [line for line in lines if line.strip() and line not in ['OVERALL', 'RURAL', 'URBAN']]
+        text = ocr_file(full_path)
+        # Collect the non-empty lines and drop the irrelevant ones
+        lines = [m.group() for m in line_pattern.finditer(text.strip()) if m.group() not in ignored_lines]
         print(lines)
         # Trim lines up to the first relevant keyword
-        delete_to_k(lines, strings_to_search_for)
+        delete_to_k(lines, keyword_pattern)
         data = []
         # Further cleaning of lines
         if "a" in lines:
             lines.remove("a")
-        matchers = ['ALL'] + strings_to_search_for
-        # Match lines that contain any of the specified keywords
-        matching = [s for s in lines if any(x in s for x in matchers)]
+        # Match region lines and the 'ALL' lines holding their figures, noting which ones are regions as they are found
+        matching = []
+        is_region = []
+        for s in lines:
+            if keyword_pattern.search(s):
+                matching.append(s)
+                is_region.append(True)
+            elif "ALL" in s:
+                matching.append(s)
+                is_region.append(False)
         print(matching)
         region = []
         result = []
         # Extract region data and corresponding results
         for j, line in enumerate(matching):
-            if any(keyword in line for keyword in strings_to_search_for):
+            if is_region[j]:
                 region.append(line)
                 try:
                     result.append(matching[j + 1])
                 except IndexError:
-                    logging.error(f"An error occurred while processing {i}")
+                    logging.error("An error occurred while processing %s", i)
         # Clean up extracted results
         for r in result:
-            r = re.sub(r"( SEXE.|SEXE.)", "", r)
+            r = sexe_pattern.sub("", r)
             data.append(r)
-        dataset = [w.split(" ") for w in data]
+        dataset = [w.split() for w in data]  # Split each row on runs of whitespace into its cells
         max_columns = max(len(row) for row in dataset)  # Determine the max number of columns
-        # Define column headers based on the number of columns detected
-        if max_columns == 7:
-            columns = ['SEX', 'TOTAL', 'MUSLIM', 'CHRISTIAN', "HINDU", 'QADIANI/AHMADI', 'CASTE/SCHEDULED']
-        elif max_columns == 8:
-            columns = ['SEX', 'TOTAL', 'MUSLIM', 'CHRISTIAN', "HINDU", 'QADIANI/AHMADI', 'CASTE/SCHEDULED', 'OTHERS']
-        elif max_columns == 9:
-            columns = ['SEX', 'TOTAL', 'MUSLIM', 'CHRISTIAN', "HINDU", 'QADIANI/AHMADI', 'CASTE/SCHEDULED', 'OTHERS', 'EXTRACOL']
-        # Create a DataFrame from the dataset
-        df = pd.DataFrame(dataset, columns=columns)
-        df['REGION'] = region
-        df['FILE_NAME'] = i
-        # Append this DataFrame to the main extracted DataFrame
-        extracted = pd.concat([extracted, df], axis=0)
+        # Look up the column headers for the number of columns detected
+        if max_columns not in column_headers:
+            raise ValueError(f"unexpected number of columns: {max_columns}")
+        columns = column_headers[max_columns]
+        # Every region line needs the result line that follows it
+        if len(region) != len(dataset):
+            raise ValueError(f"found {len(region)} regions but {len(dataset)} result rows")
+        # Pad each row to the header width and tag it with its region and file name
+        rows = [row + [None] * (len(columns) - len(row)) + [r, i] for row, r in zip(dataset, region)]
+        return columns + ['REGION', 'FILE_NAME'], rows
     except Exception as e:
-        logging.error(f"An error occurred while processing the file {i}: {e}")
+        logging.error("An error occurred while processing the file %s: %s", i, e)
 
-# Save the compiled data to an Excel file
-extracted.to_excel("Pakistan_religion.xlsx", index=False)
+if __name__ == "__main__":
+    import pandas as pd  # Pandas library for data manipulation and analysis, only needed to assemble the output
+
+    file_list = os.listdir(path)  # List of all files in the specified directory
+    print(file_list)
+
+    # OCR the image files in parallel, one process per core; map keeps the results in file_list order
+    frames = []
+    with ProcessPoolExecutor() as executor:
+        for parsed in executor.map(process_image, file_list):
+            if parsed is not None:
+                # Create a DataFrame from the parsed rows of this file
+                columns, rows = parsed
+                frames.append(pd.DataFrame(rows, columns=columns))
+
+    # DataFrame to store all extracted information, concatenated once rather than regrown for every file
+    extracted = pd.concat(frames, axis=0) if frames else pd.DataFrame()
+
+    # Store the census figures as numbers: a column is converted, downcast to the smallest integer type that fits,
+    # only when every one of its cells parses as a number, so text columns and any column with a misread figure stay text;
+    # nullable integer types from convert_dtypes keep columns holding padding for narrower pages as integers with missing values
+    for column in extracted.columns:
+        numbers = pd.to_numeric(extracted[column], errors="coerce")
+        if numbers.count() == extracted[column].count():
+            extracted[column] = pd.to_numeric(numbers.convert_dtypes(), downcast="integer")
+
+    # Save the compiled data to an Excel file with xlsxwriter, falling back to the default engine when it is not installed
+    try:
+        writer = pd.ExcelWriter("Pakistan_religion.xlsx", engine="xlsxwriter")
+    except ImportError:
+        writer = pd.ExcelWriter("Pakistan_religion.xlsx")
+    with writer:
+        extracted.to_excel(writer, index=False)